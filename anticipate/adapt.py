@@ -1,27 +1,81 @@
 
-import inspect
 import itertools
-import sys
-import traceback
+import reprlib
+from array import array
+from functools import partial
+
+from anticipate.exceptions import reduce_error
 
 __adapters__ = {}
 __mro__ = {}
+# (from_cls, to_cls) pairs mapped to the key of the registered adapter used
+# for them.
+__dispatch__ = {}
+# (from_cls, to_cls) pairs known to have no registered adapter, mapped to
+# the error message to raise for them.
+__no_adapter__ = {}
+# Maps each class to the cached (from_cls, to_cls) pairs that have it in the
+# MRO of `to_cls`, so registering an adapter only invalidates the pairs it
+# could change.
+__dependents__ = {}
+# Number of times an adapter was registered to each class
+__generations__ = {}
+# Number of cached pairs invalidated by registering each (from_cls, to_cls)
+__invalidations__ = {}
+
+# Error collection policies for `max_errors`
+FAIL_FAST = 1
+COLLECT_ALL = 0
+
+# Default number of errors to collect. `None` stops adapting a list at its
+# first error and reports every invalid parameter of an anticipated function.
+__max_errors__ = None
+
+# Formats values in error messages. Only long reprs are shortened so
+# adapting a huge value does not build a huge message.
+_repr = reprlib.Repr()
+_repr.maxstring = _repr.maxother = _repr.maxlong = 200
+_repr.maxlist = _repr.maxtuple = _repr.maxdict = 20
+_repr.maxset = _repr.maxfrozenset = _repr.maxdeque = _repr.maxarray = 20
+
+# Whether `adapt_all` converts typed arrays of the wrong numeric type
+__convert_arrays__ = False
+
+# `array.array` typecodes and NumPy dtype kinds whose items are instances
+# of each numeric type, and the typecode and dtype to convert them to.
+__typecodes__ = {
+    int: ('bBhHiIlLqQ', 'iu', 'q', 'int64'),
+    float: ('fd', 'f', 'd', 'float64'),
+}
+
 __all__ = [
     'AdaptError',
     'AdaptErrors',
+    'AdaptAllErrors',
     'AdapterExists',
     'adapt',
     'adapt_all',
+    'adapt_each',
     'register_adapter',
     'clear_adapters',
+    'dispatch_stats',
+    'dump_adapters',
+    'load_adapters',
+    'get_max_errors',
+    'set_convert_arrays',
+    'set_max_errors',
 ]
 
 
 class AdaptError(Exception):
-    pass
+    __slots__ = ()
+
+    def __reduce__(self):
+        return reduce_error(self)
 
 
 class AdaptErrors(AdaptError):
+    __slots__ = ('errors',)
 
     def __init__(self, message, errors=None):
         super(AdaptErrors, self).__init__(message)
@@ -30,6 +84,15 @@ class AdaptErrors(AdaptError):
             self.add_errors(errors)
 
     def add_error(self, func, ex_type, ex, tb):
+        """
+        Tracebacks are stored as a tuple of `(filename, lineno, name)` frames
+        and exceptions are stored as a copy without their traceback, so that
+        errors do not keep the frames they were raised in alive.
+        """
+        if tb is not None and not isinstance(tb, tuple):
+            tb = _extract_frames(tb)
+        if isinstance(ex, BaseException):
+            ex = _detach(ex)
         self.errors.append((func, ex_type, ex, tb))
 
     def add_errors(self, errors):
@@ -40,13 +103,66 @@ class AdaptErrors(AdaptError):
         """
         Returns all errors as a string
         """
+        import traceback
+
         output = []
         for e in self.errors:
             output.append('%s: %s in %s:' % (e[1], e[2], e[0]))
-            output.append(''.join(traceback.format_tb(e[3])))
+            output.append(''.join(traceback.format_list(
+                [frame + (None,) for frame in e[3] or ()])))
         return '\n'.join(output)
 
 
+class AdaptAllErrors(AdaptErrors):
+    """
+    Raised when items of an iterable could not be adapted.
+
+    `positions` holds the index of the item for each error. `truncated` is
+    set if adapting stopped because the maximum number of errors was
+    reached.
+    """
+    __slots__ = ('positions', 'truncated')
+
+    def __init__(self, message, errors=None, positions=(), truncated=False):
+        super(AdaptAllErrors, self).__init__(message, errors=errors)
+        self.positions = tuple(positions)
+        self.truncated = truncated
+
+
+def _detach(ex):
+    """
+    Returns a copy of `ex` without its traceback, cause or context. The
+    exception itself is left alone since the caller may still use it.
+    """
+    if ex.__traceback__ is None and ex.__context__ is None and ex.__cause__ is None:
+        return ex
+
+    import copy
+
+    try:
+        clone = copy.copy(ex)
+    except Exception:
+        # `__init__` takes different arguments than `args`
+        clone = type(ex).__new__(type(ex), *ex.args)
+        clone.__dict__.update(getattr(ex, '__dict__', {}))
+
+    clone.__traceback__ = None
+    clone.__context__ = clone.__cause__ = None
+    return clone
+
+
+def _extract_frames(tb):
+    """
+    Returns the `(filename, lineno, name)` of each frame in a traceback.
+    """
+    frames = []
+    while tb is not None:
+        code = tb.tb_frame.f_code
+        frames.append((code.co_filename, tb.tb_lineno, code.co_name))
+        tb = tb.tb_next
+    return tuple(frames)
+
+
 class AdapterExists(Exception):
     pass
 
@@ -55,14 +171,73 @@ def get_adapter_path(obj, to_cls):
     """
     Returns the adapter path that would be used to adapt `obj` to `to_cls`.
     """
-    from_cls = type(obj)
+    return _adapter_path(type(obj), to_cls)
+
+
+def _adapter_path(from_cls, to_cls):
     key = (from_cls, to_cls)
     if key not in __mro__:
-        __mro__[key] = list(itertools.product(inspect.getmro(from_cls), inspect.getmro(to_cls)))
+        __mro__[key] = list(itertools.product(from_cls.__mro__, to_cls.__mro__))
 
     return __mro__[key]
 
 
+def _generations(to_cls):
+    return tuple(__generations__.get(cls, 0) for cls in to_cls.__mro__)
+
+
+def _dispatch(key):
+    """
+    Find the registered adapter key to use for a (from_cls, to_cls) pair
+    and cache it.
+
+    Returns a tuple of the adapter key and the error message to raise if
+    there is no adapter.
+    """
+    from_cls, to_cls = key
+    generations = _generations(to_cls)
+
+    adapter_key = message = None
+    for k in _adapter_path(from_cls, to_cls):
+        if k in __adapters__:
+            adapter_key = k
+            break
+    else:
+        message = 'Could not adapt %r to %r' % key
+
+    # Do not cache the result if an adapter was registered meanwhile
+    if _generations(to_cls) == generations:
+        if adapter_key is None:
+            __no_adapter__[key] = message
+        else:
+            __dispatch__[key] = adapter_key
+        for cls in to_cls.__mro__:
+            __dependents__.setdefault(cls, set()).add(key)
+
+    return adapter_key, message
+
+
+def _invalidate(from_cls, to_cls):
+    """
+    Forget cached pairs that registering an adapter from `from_cls` to
+    `to_cls` could change. Returns the number of pairs invalidated.
+    """
+    __generations__[to_cls] = __generations__.get(to_cls, 0) + 1
+
+    count = 0
+    for key in list(__dependents__.get(to_cls, ())):
+        if from_cls in key[0].__mro__:
+            for cls in key[1].__mro__:
+                __dependents__.get(cls, set()).discard(key)
+            __dispatch__.pop(key, None)
+            __no_adapter__.pop(key, None)
+            count += 1
+
+    key = (from_cls, to_cls)
+    __invalidations__[key] = __invalidations__.get(key, 0) + count
+    return count
+
+
 def adapt(obj, to_cls):
     """
     Will adapt `obj` to an instance of `to_cls`.
@@ -83,38 +258,212 @@ def adapt(obj, to_cls):
         try:
             return obj.__adapt__(to_cls)
         except (AdaptError, TypeError) as e:
-            ex_type, ex, tb = sys.exc_info()
-            errors.append((obj.__adapt__, ex_type, ex, tb))
+            errors.append((obj.__adapt__, type(e), e, e.__traceback__))
 
     if hasattr(to_cls, '__adapt__') and to_cls.__adapt__:
         try:
             return to_cls.__adapt__(obj)
         except (AdaptError, TypeError) as e:
-            ex_type, ex, tb = sys.exc_info()
-            errors.append((to_cls.__adapt__, ex_type, ex, tb))
-
-    for k in get_adapter_path(obj, to_cls):
-        if k in __adapters__:
-            try:
-                return __adapters__[k](obj, to_cls)
-            except (AdaptError, TypeError) as e:
-                ex_type, ex, tb = sys.exc_info()
-                errors.append((__adapters__[k], ex_type, ex, tb))
-                break
+            errors.append((to_cls.__adapt__, type(e), e, e.__traceback__))
+
+    # `__adapt__` hooks may vary per instance, so they are always tried
+    # above. Only the registry lookup is cached.
+    key = (type(obj), to_cls)
+    adapter_key = __dispatch__.get(key)
+    message = None
+    if adapter_key is None:
+        message = __no_adapter__.get(key)
+        if message is None:
+            adapter_key, message = _dispatch(key)
+
+    func = __adapters__.get(adapter_key)
+    if func is None and message is None:
+        # The adapter was cleared since the pair was cached
+        __dispatch__.pop(key, None)
+        adapter_key, message = _dispatch(key)
+        func = __adapters__.get(adapter_key)
+
+    if func is not None:
+        try:
+            return func(obj, to_cls)
+        except (AdaptError, TypeError) as e:
+            errors.append((func, type(e), e, e.__traceback__))
+    elif not errors:
+        # Nothing was attempted so there is no need to format `obj`
+        raise AdaptErrors(message)
 
-    raise AdaptErrors('Could not adapt %r to %r' % (obj, to_cls), errors=errors)
+    error = AdaptErrors(
+        'Could not adapt %s to %r' % (_repr.repr(obj), to_cls), errors=errors)
+    # The traceback of `error` keeps this frame alive, so do not let it keep
+    # the original tracebacks too
+    del errors[:]
+    raise error
 
 
-def adapt_all(iterable, to_cls):
+def adapt_all(iterable, to_cls, max_errors=None, convert=None, container=list):
     """
     Returns a list of items from adapting each item in iterable to `cls`
 
-    If `iterable` is `None`, an empty list will be returned.
+    If `iterable` is `None`, an empty list will be returned. `container` is
+    called with an iterable of the adapted items to build the list instead
+    of copying it from a `list`.
+
+    If `to_cls` is `int` or `float` and `iterable` is an `array.array` or a
+    one dimensional NumPy array with items of that type, it is returned as
+    is without checking each item. If `convert` is set, typed arrays of the
+    other numeric type are converted, and an `AdaptError` is raised if any
+    value would change. Defaults to `set_convert_arrays`. NumPy arrays are
+    converted as a whole with `astype`. `array.array` has no such
+    conversion, so `to_cls` is still called for each item, but without the
+    adapter lookup of `adapt`.
+
+    `max_errors` is the number of items that may fail before giving up.
+    `FAIL_FAST` raises the first error as is. Otherwise an `AdaptAllErrors`
+    with the position of each error is raised once all items are adapted or
+    `max_errors` is reached. `COLLECT_ALL` never gives up. Defaults to
+    `set_max_errors`, or `FAIL_FAST` if not set.
     """
     if iterable is None:
-        return []
+        return container()
+
+    if to_cls in __typecodes__:
+        typed = _adapt_array(iterable, to_cls, convert)
+        if typed is not None:
+            return typed
+
+    max_errors = _item_max_errors(max_errors)
+    if max_errors == FAIL_FAST:
+        if container is list:
+            return [adapt(obj, to_cls) for obj in iterable]
+        return container(adapt(obj, to_cls) for obj in iterable)
+
+    return adapt_each(
+        partial(adapt, to_cls=to_cls), iterable, max_errors, container)
+
+
+def _adapt_array(iterable, to_cls, convert):
+    """
+    Returns `iterable`, or a converted copy, if it is a typed array that
+    holds `to_cls` values. Returns `None` if it is not a typed array.
+    """
+    typecodes, kinds, typecode, dtype = __typecodes__[to_cls]
+    if convert is None:
+        convert = __convert_arrays__
+
+    if isinstance(iterable, array):
+        if iterable.typecode in typecodes:
+            return iterable
+        if not convert or iterable.typecode not in 'bBhHiIlLqQfd':
+            return None
+        try:
+            converted = array(typecode, map(to_cls, iterable))
+        except (ValueError, OverflowError) as e:
+            raise AdaptError('Could not convert array to %r: %s' % (to_cls, e))
+        if converted != iterable:
+            raise AdaptError('Converting array to %r would change values' % to_cls)
+        return converted
+
+    kind = getattr(getattr(iterable, 'dtype', None), 'kind', None)
+    if kind is None or getattr(iterable, 'ndim', None) != 1:
+        return None
+    if kind in kinds:
+        return iterable
+    if not convert or kind not in 'iuf':
+        return None
+    converted = iterable.astype(dtype)
+    if not (converted.astype(iterable.dtype) == iterable).all():
+        raise AdaptError('Converting array to %r would change values' % to_cls)
+    return converted
+
+
+def adapt_each(func, iterable, max_errors=None, container=list):
+    """
+    Returns a list of the results of calling `func` with each item in
+    `iterable`, collecting errors like `adapt_all`. The results are built
+    into `container` like `adapt_all`.
+    """
+    max_errors = _item_max_errors(max_errors)
+    if max_errors == FAIL_FAST:
+        if container is list:
+            return [func(obj) for obj in iterable]
+        return container(func(obj) for obj in iterable)
+
+    errors = []
+    positions = []
+    results = container(
+        _collect(func, iterable, max_errors, errors, positions))
+
+    if errors:
+        truncated = len(positions) == max_errors
+        shown = ', '.join(str(i) for i in positions[:10])
+        if len(positions) > 10 or truncated:
+            shown += ', ...'
+        error = AdaptAllErrors(
+            'Could not adapt %d items (at %s)' % (len(positions), shown),
+            errors=errors,
+            positions=positions,
+            truncated=truncated)
+        # Do not keep the original tracebacks alive through this frame, see
+        # `adapt`
+        del errors[:]
+        raise error
+
+    return results
+
+
+def _collect(func, iterable, max_errors, errors, positions):
+    """
+    Yields the results of calling `func` with each item in `iterable`.
+    Errors are added to `errors` and `positions` until there are
+    `max_errors` of them.
+    """
+    for i, obj in enumerate(iterable):
+        try:
+            result = func(obj)
+        except (AdaptError, TypeError, ValueError) as e:
+            errors.append((func, type(e), e, e.__traceback__))
+            positions.append(i)
+            if len(positions) == max_errors:
+                return
+        else:
+            yield result
+
+
+def _item_max_errors(max_errors):
+    if max_errors is None:
+        max_errors = __max_errors__
+    if max_errors is None:
+        return FAIL_FAST
+    return max_errors
+
+
+def set_convert_arrays(convert):
+    """
+    Set whether `adapt_all` converts typed arrays of the wrong numeric type
+    by default.
+    """
+    global __convert_arrays__
+    __convert_arrays__ = convert
 
-    return [adapt(obj, to_cls) for obj in iterable]
+
+def get_max_errors():
+    """
+    Returns the default number of errors to collect, see `set_max_errors`.
+    """
+    return __max_errors__
+
+
+def set_max_errors(max_errors):
+    """
+    Set the default number of errors to collect before giving up, both for
+    items of lists and for parameters of anticipated functions.
+
+    `FAIL_FAST` stops at the first error and `COLLECT_ALL` collects every
+    error. `None` restores the default of stopping at the first error in a
+    list and reporting every invalid parameter.
+    """
+    global __max_errors__
+    __max_errors__ = max_errors
 
 
 def register_adapter(from_classes, to_classes, func):
@@ -134,6 +483,7 @@ def register_adapter(from_classes, to_classes, func):
         if key in __adapters__:
             raise AdapterExists('%r to %r already exists.' % key)
         __adapters__[key] = func
+        _invalidate(*key)
 
 
 def clear_adapters():
@@ -141,3 +491,46 @@ def clear_adapters():
     Unregister any previously defined adapters.
     """
     __adapters__.clear()
+    __dispatch__.clear()
+    __no_adapter__.clear()
+    __dependents__.clear()
+
+
+def dump_adapters():
+    """
+    Returns the registered adapters as a list of `(from_cls, to_cls, func)`
+    that can be pickled and passed to `load_adapters` in another process.
+
+    Example::
+
+        ProcessPoolExecutor(
+            initializer=load_adapters, initargs=(dump_adapters(),))
+    """
+    return [key + (func,) for key, func in __adapters__.items()]
+
+
+def load_adapters(adapters):
+    """
+    Register adapters returned by `dump_adapters`. Adapters that are already
+    registered with the same function, for example by importing the module
+    that defines them, are skipped.
+    """
+    for from_cls, to_cls, func in adapters:
+        if __adapters__.get((from_cls, to_cls)) is not func:
+            register_adapter(from_cls, to_cls, func)
+
+
+def dispatch_stats():
+    """
+    Returns a dict describing the cached adapter lookups:
+
+    - `cached`: Number of cached (from_cls, to_cls) pairs
+    - `generations`: Number of adapters registered to each class
+    - `invalidations`: Number of cached pairs each registered
+      (from_cls, to_cls) invalidated
+    """
+    return {
+        'cached': len(__dispatch__) + len(__no_adapter__),
+        'generations': dict(__generations__),
+        'invalidations': dict(__invalidations__),
+    }
@@ -0,0 +1,241 @@
+import sys
+from array import array
+from operator import itemgetter
+
+from anticipate.adapt import AdaptError, AdaptErrors, adapt
+
+from collections.abc import Mapping
+
+__all__ = [
+    'Columnar',
+    'columnar',
+]
+
+# Column types that are stored in an `array.array` instead of a list
+TYPECODES = {
+    int: 'q',
+    float: 'd',
+}
+
+
+class Columnar(object):
+    """
+    A table stored as one sequence per column.
+
+    Subclasses declare their columns in `__columns__` as a sequence of
+    `(name, type)` pairs. `int` and `float` columns are stored in
+    `array.array`, other columns in lists. Use `columnar` to create a
+    subclass.
+
+    A `Columnar` subclass can be used as an anticipated type. Rows given as
+    dicts or tuples are converted in one pass and each column is checked
+    against its type::
+
+        Orders = columnar('Orders', [('id', int), ('price', float)])
+
+        @anticipate(orders=Orders)
+        def total(orders):
+            return sum(orders.price)
+
+        total([{'id': 1, 'price': 2.5}, {'id': 2, 'price': 1.0}])
+        total([(1, 2.5), (2, 1.0)])
+
+    A dict of sequences is used as the columns, without copying, if each
+    sequence already has the right type::
+
+        total({'id': array('q', [1, 2]), 'price': [2.5, 1.0]})
+    """
+    __slots__ = ('columns', 'length')
+    __columns__ = ()
+
+    def __init__(self, columns, length):
+        """
+        Args:
+            columns (dict): Map of column name to a sequence of values that
+                has already been checked.
+            length (int): Number of rows.
+        """
+        self.columns = columns
+        self.length = length
+
+    @classmethod
+    def __adapt__(cls, obj):
+        if isinstance(obj, Mapping):
+            return cls.from_columns(obj)
+        return cls.from_rows(obj)
+
+    @classmethod
+    def from_rows(cls, rows):
+        """
+        Create a table from an iterable of dicts or tuples.
+        """
+        if not isinstance(rows, (list, tuple)):
+            rows = list(rows)
+
+        names = [name for name, _ in cls.__columns__]
+
+        if not rows:
+            values = [()] * len(names)
+        elif isinstance(rows[0], Mapping):
+            getter = itemgetter(*names)
+            try:
+                if len(names) == 1:
+                    values = [[getter(row) for row in rows]]
+                else:
+                    values = list(zip(*map(getter, rows)))
+            except KeyError as e:
+                raise AdaptError('Row is missing column %s' % e)
+        else:
+            for i, row in enumerate(rows):
+                if len(row) != len(names):
+                    raise AdaptError(
+                        'Row %d has %d values, expected %d'
+                        % (i, len(row), len(names)))
+            values = list(zip(*rows))
+
+        columns = {}
+        for (name, to_cls), column in zip(cls.__columns__, values):
+            columns[name] = _convert_column(name, column, to_cls)
+
+        return cls(columns, len(rows))
+
+    @classmethod
+    def from_columns(cls, data):
+        """
+        Create a table from a dict of sequences. Sequences that already have
+        the right type are used without copying.
+        """
+        columns = {}
+        length = None
+        for name, to_cls in cls.__columns__:
+            try:
+                column = data[name]
+            except KeyError:
+                raise AdaptError('Missing column %r' % name)
+
+            if not _is_column(column, to_cls):
+                column = _convert_column(name, column, to_cls)
+
+            if length is None:
+                length = len(column)
+            elif len(column) != length:
+                raise AdaptError(
+                    'Column %r has %d values, expected %d'
+                    % (name, len(column), length))
+
+            columns[name] = column
+
+        return cls(columns, length or 0)
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def __getattr__(self, name):
+        if name in Columnar.__slots__:
+            raise AttributeError(name)
+        try:
+            return self.columns[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __iter__(self):
+        """
+        Iterate over rows as tuples.
+        """
+        return zip(*[self.columns[name] for name, _ in self.__columns__])
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return NotImplemented
+        return all(
+            list(self.columns[name]) == list(other.columns[name])
+            for name, _ in self.__columns__)
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    __hash__ = None
+
+    def __repr__(self):
+        return '<%s: %d rows>' % (type(self).__name__, self.length)
+
+
+def columnar(name, columns, module=None):
+    """
+    Create a `Columnar` subclass.
+
+    Args:
+        name (str): Name of the class.
+        columns (list): Sequence of `(name, type)` pairs.
+        module (str): Module the class is defined in. Defaults to the module
+            of the caller so the class and its instances can be pickled.
+    """
+    if module is None:
+        try:
+            module = sys._getframe(1).f_globals.get('__name__', '__main__')
+        except (AttributeError, ValueError):
+            pass
+
+    cls = type(name, (Columnar,), {
+        '__slots__': (),
+        '__columns__': tuple((n, t) for n, t in columns),
+    })
+    if module is not None:
+        cls.__module__ = module
+    return cls
+
+
+def _is_column(column, to_cls):
+    """
+    Check if `column` can be used as is for a column of `to_cls`.
+    """
+    typecode = TYPECODES.get(to_cls)
+    if typecode is not None and isinstance(column, array):
+        return column.typecode == typecode
+    if not isinstance(column, (list, tuple)):
+        return False
+    for value in column:
+        if not isinstance(value, to_cls):
+            return False
+    return True
+
+
+def _convert_column(name, values, to_cls):
+    """
+    Returns `values` as a column of `to_cls`.
+    """
+    typecode = TYPECODES.get(to_cls)
+    if typecode is not None:
+        try:
+            return array(typecode, values)
+        except (TypeError, OverflowError):
+            # Fall back to adapting each value
+            pass
+
+    column = []
+    for i, value in enumerate(values):
+        if not isinstance(value, to_cls):
+            try:
+                value = adapt(value, to_cls)
+            except (AdaptError, TypeError, ValueError) as e:
+                raise AdaptErrors(
+                    'Column %r row %d: could not adapt %r to %r'
+                    % (name, i, type(value), to_cls),
+                    errors=[(adapt, type(e), e, e.__traceback__)])
+            if value is None:
+                raise AdaptError(
+                    'Column %r row %d: value is None' % (name, i))
+        column.append(value)
+
+    if typecode is not None:
+        try:
+            return array(typecode, column)
+        except (TypeError, OverflowError) as e:
+            raise AdaptError('Column %r: %s' % (name, e))
+    return column
@@ -1,21 +1,215 @@
-from functools import partial, update_wrapper
+import os
+from types import MethodType
 
 from builtins import zip
 from builtins import object
 
-from anticipate.adapt import AdaptError, AdaptErrors, adapt, adapt_all, register_adapter
+from anticipate.adapt import (
+    AdaptAllErrors, AdaptError, AdaptErrors, _detach, adapt, adapt_all,
+    adapt_each, get_max_errors, register_adapter)
 from anticipate.exceptions import AnticipateErrors, AnticipateParamError
-
-from inspect import getfullargspec
+from anticipate.trusted import TrustedList, is_trusted, trust
 
 __all__ = [
     'adapter',
     'anticipate',
     'anticipate_wrapper',
+    'deferred_anticipate',
+    'lazy',
     'register_adapter',
     'strictly_anticipate',
 ]
 
+# When `ANTICIPATE_DEBUG` is `1`, `true` or `yes`, decorated functions are
+# checked against their signature as soon as they are decorated instead of on
+# their first call.
+DEBUG = os.environ.get('ANTICIPATE_DEBUG', '').lower() in ('1', 'true', 'yes')
+
+
+class _function_attribute(str):
+    """
+    Class attribute of `anticipate_wrapper` that reads an attribute of the
+    wrapped function.
+
+    This lets wrappers look like the function without copying its metadata
+    into an instance `__dict__` like `update_wrapper` would. It is a `str`
+    so it can also stand in for the class's own `__module__` and `__doc__`.
+    """
+    def __new__(cls, name, value):
+        self = str.__new__(cls, value)
+        self.name = name
+        return self
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        return getattr(instance.func, self.name)
+
+
+def _adapt_with(value, spec):
+    """
+    Adapt `value` using an object that implements `adapt`.
+    """
+    return spec.adapt(value)
+
+
+def _adapt_trusted(value, spec):
+    """
+    Adapt `value` using an object that implements `adapt` and sets
+    `trust_results`. Values it has already adapted are returned as is.
+    """
+    if is_trusted(value, spec):
+        return value
+    return trust(spec.adapt(value), spec)
+
+
+def _adapt_each(iterable, spec):
+    """
+    Adapt each item in `iterable` using an object that implements `adapt`.
+    Returns an empty list if iterable is `None`.
+    """
+    if iterable is None:
+        return []
+    if type(iterable) is TrustedList and iterable.anticipated is spec:
+        return iterable
+    result = adapt_each(spec.adapt, iterable, container=TrustedList)
+    result.anticipated = spec
+    return result
+
+
+def _adapt_list(iterable, to_cls):
+    """
+    Adapt each item in `iterable` to `to_cls`.
+    Returns an empty list if iterable is `None`.
+    """
+    if iterable is None:
+        return []
+    if type(iterable) is TrustedList and iterable.anticipated is to_cls:
+        return iterable
+    result = adapt_all(iterable, to_cls, container=TrustedList)
+    if type(result) is TrustedList:
+        # Typed arrays are returned as is
+        result.anticipated = to_cls
+    return result
+
+
+def _is_anticipated(value, func, target):
+    """
+    Check if `func(value, target)` from `_get_adapter` would return `value`
+    as is, without calling registered adapters.
+    """
+    if func is adapt:
+        return value is None or isinstance(value, target)
+    elif func is _adapt_with or func is _adapt_trusted:
+        return is_trusted(value, target) or target.adapt(value) is value
+    elif value is None:
+        return True
+
+    try:
+        if iter(value) is value:
+            # An iterator would have been adapted to a list
+            return False
+    except TypeError:
+        return False
+
+    if func is _adapt_list:
+        for item in value:
+            if item is not None and not isinstance(item, target):
+                return False
+        return True
+    for item in value:
+        if target.adapt(item) is not item:
+            return False
+    return True
+
+
+def _param_error(key, val, anticipated, e):
+    """
+    Returns an `AnticipateParamError` for an error raised adapting `val`.
+    """
+    if hasattr(e, 'errors') and not isinstance(e, AdaptAllErrors):
+        errors = e.errors
+    else:
+        errors = [_detach(e)]
+
+    return AnticipateParamError(
+        message='Input value %r for parameter `%s` does not match '
+            'anticipated type %r' % (type(val), key, anticipated),
+        name=key,
+        value=val,
+        anticipated=anticipated,
+        errors=errors)
+
+
+class lazy(object):
+    """
+    Anticipate a parameter without adapting it until it is used.
+
+    The function is passed a `LazyParam` instead of the value. Calling it
+    adapts the value the first time and returns the result. An
+    `AnticipateParamError` is raised when it is called if the value can not
+    be adapted. A parameter that is not passed gets a `LazyParam` for its
+    default value.
+
+    Example::
+
+        @anticipate(order=lazy(Order))
+        def update(order, quantity=None):
+            if quantity is not None:
+                order().quantity = quantity
+    """
+    __slots__ = ('anticipated',)
+
+    def __init__(self, anticipated):
+        self.anticipated = anticipated
+
+    def __repr__(self):
+        return 'lazy(%r)' % (self.anticipated,)
+
+
+class LazyParam(object):
+    """
+    Callable passed for a `lazy` parameter. Adapts the value when first
+    called.
+    """
+    __slots__ = ('name', 'value', 'anticipated', '_func', '_target', '_result')
+
+    def __init__(self, value, name, func, target, anticipated):
+        self.name = name
+        self.value = value
+        self.anticipated = anticipated
+        self._func = func
+        self._target = target
+
+    def __call__(self):
+        try:
+            return self._result
+        except AttributeError:
+            pass
+
+        try:
+            result = self._func(self.value, self._target)
+        except (AdaptError, AdaptErrors, TypeError, ValueError) as e:
+            error = _param_error(self.name, self.value, self.anticipated, e)
+        else:
+            self._result = result
+            return result
+
+        # Raised outside the handler so the error does not keep `e` and its
+        # frames alive as its `__context__`
+        raise error
+
+    def __repr__(self):
+        return '<LazyParam %s=%r>' % (self.name, self.anticipated)
+
+
+def _defer(value, target):
+    """
+    Returns a `LazyParam` for `value`. `target` is the `LazyParam` arguments
+    after the value.
+    """
+    return LazyParam(value, *target)
+
 
 class anticipate_wrapper(object):
     """
@@ -23,34 +217,109 @@ class anticipate_wrapper(object):
 
     Handles checking or adapting the return type and input parameters.
     """
-    def __init__(self, func, returns, params, strict=False):
+    __slots__ = (
+        'func',
+        'returns',
+        'params',
+        'strict',
+        'deferred',
+        'arg_names',
+        'param_adapters',
+        '_positional',
+        '_lazy_defaults',
+        '_adapt_result',
+        '_submit',
+        '_compiled',
+        '__weakref__',
+    )
+
+    # Make this look like the original function
+    __module__ = _function_attribute('__module__', __module__)
+    __doc__ = _function_attribute('__doc__', __doc__)
+
+    def __init__(self, func, returns, params, strict=False, deferred=False):
         self.func = func
         self.returns = returns
         self.params = params
-        self._adapt_result = self._get_adapter(self.returns) if self.returns else None
         self.strict = strict
+        self.deferred = deferred
+        self._compiled = False
 
-        args, _, kwargs, _ = getfullargspec(func)[:4]
+        if DEBUG:
+            self._compile()
 
-        self.arg_names = args
+    @property
+    def __wrapped__(self):
+        return self.func
+
+    def __getattr__(self, name):
+        """
+        Look up attributes, like `__name__`, on the wrapped function.
+        """
+        if name in anticipate_wrapper.__slots__:
+            raise AttributeError(name)
+        return getattr(self.func, name)
+
+    def __setattr__(self, name, value):
+        """
+        Attributes that are not used by the wrapper are set on the wrapped
+        function.
+        """
+        if name in anticipate_wrapper.__slots__:
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self.func, name, value)
+
+    def _compile(self):
+        """
+        Inspect the function signature and build the adapters.
+
+        This is deferred until the wrapper is first used so that decorating
+        a function is cheap.
+        """
+        from inspect import getfullargspec
+
+        args, _, kwargs, defaults = getfullargspec(self.func)[:4]
 
         if not kwargs:
             # If kwargs are accepted then any parameter name can be used.
             # Otherwise, we check to see if there are parameters that do not
             # match the funtion signature. This is a safety precaution to
             # protect againts typo in parameter names.
-            invalid_params = set(self.params.keys()) - set(self.arg_names)
+            invalid_params = set(self.params.keys()) - set(args)
             if invalid_params:
                 raise KeyError(
                     'Invalid anticipate parameters found that do not match '
                     'function signature: %s' % ', '.join(invalid_params))
 
-        self.param_adapters = {}
-        for key, p in self.params.items():
-            self.param_adapters[key] = self._get_adapter(p)
-
-        # Make this look like the original function
-        update_wrapper(self, self.func)
+        # Adapters are kept in tuples of `(name, func, target)` which are
+        # called as `func(value, target)`.
+        param_adapters = tuple(
+            self._get_param_adapter(key, p) for key, p in self.params.items())
+
+        by_name = dict((entry[0], entry) for entry in param_adapters)
+        positional = tuple(by_name.get(name) for name in args)
+        while positional and positional[-1] is None:
+            positional = positional[:-1]
+
+        self.arg_names = tuple(args)
+        self.param_adapters = param_adapters
+        self._positional = positional
+
+        # Lazy parameters that are not passed get a `LazyParam` for their
+        # default so the function can always call them.
+        defaults = dict(zip(reversed(args), reversed(defaults or ())))
+        self._lazy_defaults = tuple(
+            (args.index(entry[0]), entry, defaults[entry[0]])
+            for entry in param_adapters
+            if entry[1] is _defer and entry[0] in defaults)
+        self._adapt_result = self._get_adapter(self.returns) if self.returns else None
+        self._submit = None
+        if self.deferred and (self.returns or self.strict):
+            # Without `returns` or `strict` there is nothing to check
+            from anticipate.deferred import submit
+            self._submit = submit
+        self._compiled = True
 
     def __get__(self, instance, owner):
         """
@@ -60,7 +329,16 @@ class anticipate_wrapper(object):
         `__get__` will be called in this case which gives us an opportunity to
         bind to the instance.
         """
-        return partial(self.__call__, instance)
+        if instance is None:
+            return self
+        return MethodType(self, instance)
+
+    def __reduce__(self):
+        """
+        Pickle by qualified name like a function, so anticipated functions
+        and methods can be sent to other processes.
+        """
+        return self.__qualname__
 
     def __unadapted__(self, *args, **kwargs):
         """
@@ -72,24 +350,22 @@ class anticipate_wrapper(object):
         """
         Adapt the value if an adapter is defined.
         """
-        if key in self.param_adapters:
-            try:
-                return self.param_adapters[key](val)
-            except (AdaptError, AdaptErrors, TypeError, ValueError) as e:
-                if hasattr(e, 'errors'):
-                    errors = e.errors
-                else:
-                    errors = [e]
-
-                raise AnticipateParamError(
-                    message='Input value %r for parameter `%s` does not match '
-                        'anticipated type %r' % (type(val), key, self.params[key]),
-                    name=key,
-                    value=val,
-                    anticipated=self.params[key],
-                    errors=errors)
-        else:
-            return val
+        for entry in self.param_adapters:
+            if entry[0] == key:
+                return self._adapt_entry(entry, val)
+        return val
+
+    def _adapt_entry(self, entry, val):
+        """
+        Adapt the value with an entry from `param_adapters`.
+        """
+        key, func, target = entry
+        try:
+            return func(val, target)
+        except (AdaptError, AdaptErrors, TypeError, ValueError) as e:
+            error = _param_error(key, val, self.params[key], e)
+        # Raised outside the handler, see `LazyParam.__call__`
+        raise error
 
     def __call__(self, *args, **kwargs):
         """
@@ -106,25 +382,40 @@ class anticipate_wrapper(object):
         Returns a tuple of adapted (args, kwargs) or raises
         AnticipateErrors
         """
+        if not self._compiled:
+            self._compile()
+
         errors = []
+        # `None` and `COLLECT_ALL` report every invalid parameter
+        max_errors = get_max_errors() or None
 
-        if args and self.arg_names:
+        if args and self._positional:
             args = list(args)
             # Replace args inline that have adapters
-            for i, (key, val) in enumerate(zip(self.arg_names, args)):
-                try:
-                    args[i] = self._adapt_param(key, val)
-                except AnticipateParamError as e:
-                    errors.append(e)
+            for i, (entry, val) in enumerate(zip(self._positional, args)):
+                if entry is not None:
+                    try:
+                        args[i] = self._adapt_entry(entry, val)
+                    except AnticipateParamError as e:
+                        errors.append(e)
+                        if len(errors) == max_errors:
+                            break
             args = tuple(args)
 
-        if kwargs and self.params:
+        if kwargs and self.param_adapters and len(errors) != max_errors:
             # Adapt all adaptable arguments
             for key, val in kwargs.items():
                 try:
                     kwargs[key] = self._adapt_param(key, val)
                 except AnticipateParamError as e:
                     errors.append(e)
+                    if len(errors) == max_errors:
+                        break
+
+        for i, entry, default in self._lazy_defaults:
+            key, func, target = entry
+            if i >= len(args) and key not in kwargs:
+                kwargs[key] = func(default, target)
 
         if errors:
             raise AnticipateErrors(
@@ -136,15 +427,30 @@ class anticipate_wrapper(object):
     def output(self, result):
         """
         Adapts the result of a function based on the returns definition.
+
+        If the wrapper is deferred, the result is returned as is and checked
+        on a background thread.
         """
+        if not self._compiled:
+            self._compile()
+
+        if self.deferred:
+            if self._submit is not None:
+                self._submit(self, result)
+            return result
+
+        return self._output(result)
+
+    def _output(self, result):
         if self.returns:
             errors = None
             try:
-                return self._adapt_result(result)
+                func, target = self._adapt_result
+                return func(result, target)
             except AdaptErrors as e:
                 errors = e.errors
             except AdaptError as e:
-                errors = [e]
+                errors = [_detach(e)]
 
             raise AnticipateErrors(
                 message='Return value %r does not match anticipated type %r'
@@ -160,7 +466,48 @@ class anticipate_wrapper(object):
         else:
             return result
 
+    def _verify_output(self, result):
+        """
+        Check the result of a function against the returns definition
+        without adapting it. Raises `AnticipateErrors` if `output` would not
+        have returned `result` as is.
+
+        Registered adapters are never called. Objects that implement `adapt`
+        are called and must return the value they were given.
+        """
+        if not self._compiled:
+            self._compile()
+
+        if self.returns:
+            func, target = self._adapt_result
+            if not _is_anticipated(result, func, target):
+                raise AnticipateErrors(
+                    message='Return value %r does not match anticipated type '
+                        '%r' % (type(result), self.returns),
+                    errors=[])
+        elif self.strict and result is not None:
+            raise AnticipateErrors(
+                message='Return value %r does not match anticipated value '
+                'of None' % type(result),
+                errors=[])
+
+    def _get_param_adapter(self, key, p):
+        """
+        Returns the `param_adapters` entry for parameter `key`.
+        """
+        if isinstance(p, lazy):
+            func, target = self._get_adapter(p.anticipated)
+            return key, _defer, (key, func, target, p.anticipated)
+        return (key,) + self._get_adapter(p)
+
     def _get_adapter(self, to):
+        """
+        Returns a tuple of `(func, target)` where `func(value, target)` adapts
+        `value` to the anticipated type `to`.
+        """
+        if isinstance(to, lazy):
+            raise TypeError('Only parameters can be anticipated lazily')
+
         is_list = False
         if isinstance(to, list):
             # Value is a list of items matching the first element's type
@@ -173,22 +520,15 @@ class anticipate_wrapper(object):
         if not isinstance(to, type) and hasattr(to, 'adapt'):
             # The to type is an object, not a class, use its adapt method
             if is_list:
-                return partial(self._each, to.adapt)
+                return _adapt_each, to
+            elif getattr(to, 'trust_results', False):
+                return _adapt_trusted, to
             else:
-                return to.adapt
+                return _adapt_with, to
         elif is_list:
-            return partial(adapt_all, to_cls=to)
+            return _adapt_list, to
         else:
-            return partial(adapt, to_cls=to)
-
-    def _each(self, func, iterable):
-        """
-        Runs `func` over each item in the iterable and returns a list.
-        Returns an empty list if iterable is `None`.
-        """
-        if func is None:
-            return []
-        return [func(obj) for obj in iterable]
+            return adapt, to
 
 
 class anticipate(object):
@@ -251,6 +591,22 @@ class strictly_anticipate(object):
         return anticipate_wrapper(func, self.returns, self.params, strict=True)
 
 
+class deferred_anticipate(object):
+    """
+    Like `anticipate` but the return value is not adapted. It is returned as
+    is and checked on a background thread. Return values that do not match
+    are reported with the handler set by
+    `anticipate.deferred.set_violation_handler` instead of being raised.
+    By default they are logged.
+    """
+    def __init__(self, returns=None, **params):
+        self.returns = returns
+        self.params = params
+
+    def __call__(self, func):
+        return anticipate_wrapper(func, self.returns, self.params, deferred=True)
+
+
 class adapter(object):
     """
     A decorator that registers an adapter
@@ -0,0 +1,139 @@
+"""
+Checks return values on a background thread.
+
+Used by `deferred_anticipate`. The value is returned to the caller as is and
+queued to be checked against `returns`. Problems are reported to a handler
+instead of being raised. The queue is bounded and values are dropped when
+it is full so checking never blocks the caller.
+
+Values are checked, not adapted. Registered adapters are never run on the
+worker thread, so a value that `anticipate` would have adapted is reported
+because the caller did not get the adapted value.
+"""
+import logging
+import os
+import threading
+import weakref
+from functools import partial
+from queue import Full, Queue
+
+__all__ = [
+    'DeferredChecker',
+    'log_violation',
+    'set_violation_handler',
+    'submit',
+]
+
+logger = logging.getLogger('anticipate')
+
+
+def log_violation(wrapper, result, error):
+    """
+    Default handler that logs a return value that did not match.
+    """
+    logger.warning('Invalid return value from %s: %s', wrapper.func, error)
+
+
+class DeferredChecker(object):
+    """
+    Checks return values of `anticipate_wrapper` on a worker thread.
+
+    Args:
+        maxsize (int): Maximum number of values waiting to be checked. Values
+            submitted when the queue is full are dropped.
+        handler (callable): Called as `handler(wrapper, result, error)` when
+            a return value does not match.
+    """
+    def __init__(self, maxsize=1000, handler=log_violation):
+        self.maxsize = maxsize
+        self.handler = handler
+        self.checked = 0
+        self.dropped = 0
+        self.violations = 0
+        self._reset()
+
+        if hasattr(os, 'register_at_fork'):
+            # The worker thread does not exist in a forked child
+            os.register_at_fork(
+                after_in_child=partial(_reset_after_fork, weakref.ref(self)))
+
+    def _reset(self):
+        self.queue = Queue(self.maxsize)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, wrapper, result):
+        """
+        Queue `result` to be checked. Returns `False` if it was dropped.
+        """
+        if self._thread is None:
+            self._start()
+
+        try:
+            self.queue.put_nowait((wrapper, result))
+        except Full:
+            with self._lock:
+                self.dropped += 1
+            return False
+        return True
+
+    def join(self):
+        """
+        Wait for all queued values to be checked.
+        """
+        self.queue.join()
+
+    def check(self, wrapper, result):
+        """
+        Check `result` and report it to the handler if it does not match.
+        """
+        try:
+            wrapper._verify_output(result)
+        except Exception as e:
+            self.violations += 1
+            try:
+                self.handler(wrapper, result, e)
+            except Exception:
+                logger.exception('Error in anticipate violation handler')
+        self.checked += 1
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                thread = threading.Thread(
+                    target=self._run, name='anticipate-deferred')
+                thread.daemon = True
+                thread.start()
+                self._thread = thread
+
+    def _run(self):
+        while True:
+            wrapper, result = self.queue.get()
+            try:
+                self.check(wrapper, result)
+            finally:
+                del wrapper, result
+                self.queue.task_done()
+
+
+def _reset_after_fork(ref):
+    checker = ref()
+    if checker is not None:
+        checker._reset()
+
+
+checker = DeferredChecker()
+
+
+def submit(wrapper, result):
+    """
+    Queue `result` to be checked by the default checker.
+    """
+    return checker.submit(wrapper, result)
+
+
+def set_violation_handler(handler):
+    """
+    Set the handler the default checker reports violations to.
+    """
+    checker.handler = handler
@@ -1,16 +1,45 @@
 from builtins import str
 
 
+def reduce_error(error):
+    """
+    Pickle support for errors that store their attributes in `__slots__`.
+
+    `Exception` only pickles `args`, which would lose the slots and call
+    `__init__` with the wrong arguments when unpickling.
+    """
+    state = {}
+    for cls in type(error).__mro__:
+        for name in cls.__dict__.get('__slots__', ()):
+            if name != '__weakref__' and hasattr(error, name):
+                state[name] = getattr(error, name)
+    return _restore_error, (type(error), error.args, state)
+
+
+def _restore_error(cls, args, state):
+    error = cls.__new__(cls)
+    error.args = args
+    for name, value in state.items():
+        setattr(error, name, value)
+    return error
+
+
 class AnticipateError(Exception):
     """
     General error for anticipate
     """
+    __slots__ = ()
+
+    def __reduce__(self):
+        return reduce_error(self)
 
 
 class AnticipateErrors(AnticipateError):
     """
     Raised when there are many anticipate errors.
     """
+    __slots__ = ('errors',)
+
     def __init__(self, message, errors=None):
         """
         Args:
@@ -33,6 +62,8 @@ class AnticipateParamError(AnticipateErrors):
     """
     Raised when a parameter can not be adapted to the anticipated type.
     """
+    __slots__ = ('name', 'value', 'anticipated')
+
     def __init__(self, message, name, value, anticipated, errors=None):
         """
         Args:
@@ -0,0 +1,102 @@
+"""
+Remembers values that have already been adapted so they are not checked
+again when passed from one anticipated function to another.
+
+Lists adapted for an anticipated list (ex: `[Order]`) are returned as a
+`TrustedList` that records the type its items were adapted to.
+
+Remembering other values costs a weak reference per adapted value, so it
+is opt-in. Values adapted by an object that implements `adapt` and sets
+`trust_results` to `True` are remembered by identity for as long as they
+are alive, if they support weak references. Sharing the same field object
+between functions lets them trust each other's values::
+
+    class OrderField(object):
+        trust_results = True
+
+        def adapt(self, value):
+            ...
+
+    ORDER = OrderField()
+
+    @anticipate(ORDER)
+    def load_order(id):
+        ...
+
+    @anticipate(order=ORDER)
+    def ship(order):
+        ...
+
+A value is trusted as it was when it was adapted. Adding items to a
+`TrustedList` makes it untrusted, but changes made to other trusted values
+are not noticed.
+"""
+import weakref
+
+__all__ = [
+    'TrustedList',
+    'is_trusted',
+    'trust',
+]
+
+# id(value) -> (weak reference to value, spec it was adapted with)
+__trusted__ = {}
+
+
+class TrustedList(list):
+    """
+    A list whose items have all been adapted to `anticipated`.
+    """
+    __slots__ = ('anticipated',)
+
+    def __init__(self, iterable=(), anticipated=None):
+        super(TrustedList, self).__init__(iterable)
+        self.anticipated = anticipated
+
+    def append(self, obj):
+        self.anticipated = None
+        super(TrustedList, self).append(obj)
+
+    def extend(self, iterable):
+        self.anticipated = None
+        super(TrustedList, self).extend(iterable)
+
+    def insert(self, index, obj):
+        self.anticipated = None
+        super(TrustedList, self).insert(index, obj)
+
+    def __setitem__(self, index, obj):
+        self.anticipated = None
+        super(TrustedList, self).__setitem__(index, obj)
+
+    def __iadd__(self, iterable):
+        self.anticipated = None
+        return super(TrustedList, self).__iadd__(iterable)
+
+
+def trust(value, spec):
+    """
+    Remember that `value` was adapted with `spec`. Values that do not support
+    weak references are not remembered.
+
+    Returns `value`.
+    """
+    if type(value).__weakrefoffset__:
+        key = id(value)
+        ref = weakref.ref(value, lambda ref: _forget(key, ref))
+        __trusted__[key] = (ref, spec)
+    return value
+
+
+def is_trusted(value, spec):
+    """
+    Check if `value` was adapted with `spec`.
+    """
+    entry = __trusted__.get(id(value))
+    return entry is not None and entry[1] is spec and entry[0]() is value
+
+
+def _forget(key, ref):
+    entry = __trusted__.get(key)
+    if entry is not None and entry[0] is ref:
+        __trusted__.pop(key, None)
@@ -0,0 +1,93 @@
+"""
+Measures the memory used by each decorated function and by each error.
+
+Run with::
+
+    PYTHONPATH=. python benchmarks/memory.py
+"""
+from __future__ import print_function
+
+import gc
+import sys
+import tracemalloc
+
+from anticipate import adapt, adapter, anticipate
+from anticipate.exceptions import AnticipateErrors
+
+COUNT = 10000
+
+
+def make_function(i):
+    def func(a, b, c=None):
+        return a
+    func.__name__ = 'func_%d' % i
+    return func
+
+
+def measure(factory, count=COUNT):
+    """
+    Returns the bytes allocated per item by calling `factory` `count` times.
+    """
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    items = [factory(i) for i in range(count)]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    size = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+    del items
+    return size / float(count)
+
+
+def main():
+    functions = [make_function(i) for i in range(COUNT)]
+
+    decorate = anticipate(int, a=int, b=[str])
+    wrapper_size = measure(lambda i: decorate(functions[i]))
+
+    def call(i):
+        wrapper = decorate(functions[i])
+        wrapper(1, ['x'])
+        return wrapper
+
+    called_wrapper_size = measure(call)
+
+    class Value(object):
+        pass
+
+    @adapter(Value, int)
+    def from_value(obj, to_cls):
+        # A local that would be kept alive if errors kept the adapter's frame
+        payload = bytearray(1024)
+        raise TypeError('Could not convert %d bytes' % len(payload))
+
+    def adapt_error(i):
+        try:
+            adapt.adapt(Value(), int)
+        except adapt.AdaptErrors as e:
+            # Measure what the error stores, not the frames of this benchmark
+            e.__traceback__ = None
+            return e
+
+    adapt_error_size = measure(adapt_error)
+
+    bad = anticipate(a=int)(lambda a: a)
+
+    def anticipate_error(i):
+        try:
+            bad(Value())
+        except AnticipateErrors as e:
+            e.__traceback__ = None
+            return e
+
+    anticipate_error_size = measure(anticipate_error)
+
+    print('Python %s' % sys.version.split()[0])
+    print('%-30s %8.1f bytes' % ('wrapper (decorated)', wrapper_size))
+    print('%-30s %8.1f bytes' % ('wrapper (called)', called_wrapper_size))
+    print('%-30s %8.1f bytes' % ('AdaptErrors', adapt_error_size))
+    print('%-30s %8.1f bytes' % ('AnticipateErrors', anticipate_error_size))
+
+
+if __name__ == '__main__':
+    main()
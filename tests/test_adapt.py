@@ -1,8 +1,30 @@
 from builtins import object
+from array import array
+import gc
+import os
+import pickle
+import subprocess
+import sys
+import weakref
+
 import pytest
-from anticipate import adapt, adapter, anticipate
+from anticipate import adapt, adapter, anticipate, decorators
+from anticipate.decorators import lazy
 from anticipate.adapt import clear_adapters
 from anticipate.exceptions import AnticipateParamError, AnticipateErrors
+from anticipate import trusted
+from anticipate.trusted import TrustedList
+
+
+@anticipate(int, value=int)
+def module_function(value):
+    return value
+
+
+class ModuleClass(object):
+    @anticipate(int, value=int)
+    def method(self, value):
+        return value
 
 
 def setup_function(function):
@@ -350,16 +372,65 @@ def test_anticipate_wrong_params():
     """
     Verify that anticipate complains if you anticipate invalid parameters
     """
+    @anticipate(foobar=int)
+    def noop(items):
+        pass
+
+    # The signature is checked on first use
     with pytest.raises(KeyError):
-        @anticipate(foobar=int)
-        def noop(items):
-            pass
+        noop(1)
 
     # Sanity check
     @anticipate(items=int)
     def noop(items):
         pass
 
+    noop(1)
+
+
+def test_anticipate_wrong_params_debug(monkeypatch):
+    """
+    Verify that in debug mode invalid parameters are reported when the
+    function is decorated.
+    """
+    monkeypatch.setattr(decorators, 'DEBUG', True)
+
+    with pytest.raises(KeyError):
+        @anticipate(foobar=int)
+        def noop(items):
+            pass
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('1', True),
+    ('true', True),
+    ('Yes', True),
+    ('', False),
+    ('0', False),
+    ('false', False),
+])
+def test_debug_environment(value, expected):
+    """
+    Verify which values of `ANTICIPATE_DEBUG` turn debug mode on.
+    """
+    env = dict(os.environ, ANTICIPATE_DEBUG=value)
+    code = 'import anticipate.decorators as d; print(d.DEBUG)'
+    output = subprocess.check_output([sys.executable, '-c', code], env=env)
+    assert output.strip() == str(expected).encode()
+
+
+def test_import_is_lightweight():
+    """
+    Verify that importing anticipate does not import `inspect` or
+    `traceback`.
+    """
+    code = (
+        'import sys, anticipate; '
+        'print(sorted({"inspect", "traceback"} & set(sys.modules)))'
+    )
+    output = subprocess.check_output([sys.executable, '-c', code])
+    assert output.strip() == b'[]'
+
 
 def test_anticipate_custom_fields():
     """
@@ -400,3 +471,646 @@ def test_anticipate_custom_fields_list():
     assert get_sum([2.33, 1.33]) == 3
 
     assert get_as_int(['2', '1']) == [2, 1]
+
+
+def test_no_adapter_cache():
+    """
+    Verify that impossible conversions are remembered and forgotten again
+    when an adapter is registered.
+    """
+    with pytest.raises(adapt.AdaptErrors):
+        adapt.adapt([1], int)
+
+    assert (list, int) in adapt.__no_adapter__
+
+    with pytest.raises(adapt.AdaptErrors) as exc_info:
+        adapt.adapt([1], int)
+
+    assert exc_info.value.errors == []
+
+    @adapter(list, int)
+    def from_list(obj, to_cls):
+        return len(obj)
+
+    assert (list, int) not in adapt.__no_adapter__
+    assert adapt.adapt([1], int) == 1
+
+
+def test_no_adapter_cache_instance_hook():
+    """
+    Verify that an `__adapt__` hook on an instance is still used when
+    other instances of its class could not be adapted.
+    """
+    class Foo(object):
+        pass
+
+    with pytest.raises(adapt.AdaptErrors):
+        adapt.adapt(Foo(), int)
+
+    foo = Foo()
+    foo.__adapt__ = lambda to_cls: to_cls(5)
+
+    assert adapt.adapt(foo, int) == 5
+
+
+def test_wrapper_looks_like_function():
+    """
+    Verify that the wrapper exposes the wrapped function's metadata and
+    attributes without an instance `__dict__`.
+    """
+    def get_num(num):
+        """Gets a number"""
+        return num
+
+    get_num.extra = 'extra'
+
+    wrapped = anticipate(num=int)(get_num)
+
+    assert type(wrapped).__dictoffset__ == 0
+    assert wrapped.__name__ == 'get_num'
+    assert wrapped.__qualname__ == get_num.__qualname__
+    assert wrapped.__module__ == __name__
+    assert wrapped.__doc__ == 'Gets a number'
+    assert wrapped.__wrapped__ is get_num
+    assert wrapped.extra == 'extra'
+
+    wrapped.other = 'other'
+    assert get_num.other == 'other'
+
+    assert wrapped('1') == 1
+
+
+def test_errors_do_not_keep_frames():
+    """
+    Verify that adapt errors store plain frame info and exceptions without
+    tracebacks, so the frames of failed adapters are not kept alive.
+    """
+    class Foo(object):
+        pass
+
+    class Local(object):
+        pass
+
+    locals_ = []
+
+    @adapter(Foo, int)
+    def from_foo(obj, to_cls):
+        local = Local()
+        locals_.append(weakref.ref(local))
+        raise TypeError('Not a number')
+
+    with pytest.raises(adapt.AdaptErrors) as exc_info:
+        adapt.adapt(Foo(), int)
+
+    e = exc_info.value
+    func, ex_type, ex, frames = e.errors[0]
+    assert func is from_foo
+    assert ex_type is TypeError
+    assert isinstance(ex, TypeError)
+    assert str(ex) == 'Not a number'
+    assert ex.__traceback__ is None
+    assert frames[-1][2] == 'from_foo'
+    assert 'Not a number' in e.errors_string()
+    assert 'from_foo' in e.errors_string()
+
+    # The traceback of the raised `AdaptErrors` does not reach the adapter
+    gc.collect()
+    assert locals_[0]() is None
+
+
+def test_anticipate_errors_do_not_keep_frames():
+    """
+    Verify that errors raised for invalid parameters and lazy parameters do
+    not keep the frames of failed adapters alive.
+    """
+    class Foo(object):
+        pass
+
+    class Local(object):
+        pass
+
+    locals_ = []
+
+    @adapter(Foo, int)
+    def from_foo(obj, to_cls):
+        local = Local()
+        locals_.append(weakref.ref(local))
+        raise TypeError('Not a number')
+
+    @anticipate(a=int, b=lazy(int))
+    def func(a, b):
+        return b()
+
+    with pytest.raises(AnticipateErrors) as exc_info:
+        func(Foo(), 1)
+    assert exc_info.value.errors[0].__context__ is None
+
+    with pytest.raises(AnticipateParamError) as lazy_info:
+        func(1, Foo())
+    assert lazy_info.value.__context__ is None
+
+    gc.collect()
+    assert len(locals_) == 2
+    assert locals_[0]() is None
+    assert locals_[1]() is None
+
+
+def test_register_invalidates_related_pairs():
+    """
+    Verify registering an adapter only invalidates the cached pairs it
+    could change.
+    """
+    class Foo(object):
+        pass
+
+    class Bar(Foo):
+        pass
+
+    class Zip(object):
+        pass
+
+    assert adapt.adapt(1.0, int) == 1
+
+    with pytest.raises(adapt.AdaptErrors):
+        adapt.adapt(Bar(), str)
+
+    with pytest.raises(adapt.AdaptErrors):
+        adapt.adapt(Zip(), str)
+
+    @adapter(Foo, str)
+    def from_foo(obj, to_cls):
+        return 'foo'
+
+    assert adapt.dispatch_stats()['invalidations'][(Foo, str)] == 1
+    assert (float, int) in adapt.__dispatch__
+    assert (Zip, str) in adapt.__no_adapter__
+    assert (Bar, str) not in adapt.__no_adapter__
+
+    assert adapt.adapt(Bar(), str) == 'foo'
+    assert adapt.__dispatch__[(Bar, str)] == (Foo, str)
+
+
+def test_trusted_list():
+    """
+    Verify that a list adapted for an anticipated list is not adapted again
+    by the next anticipated function unless items are added.
+    """
+    calls = []
+
+    class Foo(object):
+        pass
+
+    @adapter(str, Foo)
+    def to_foo(obj, to_cls):
+        calls.append(obj)
+        return to_cls()
+
+    @anticipate([Foo])
+    def load(names):
+        return names
+
+    @anticipate(foos=[Foo])
+    def use(foos):
+        return foos
+
+    foos = load(['a', 'b'])
+    assert len(calls) == 2
+    assert isinstance(foos, list)
+
+    assert use(foos) is foos
+    assert len(calls) == 2
+
+    foos.append('c')
+    assert use(foos) is not foos
+    assert len(calls) == 3
+
+
+def test_adapt_all_container():
+    """
+    Verify adapt_all builds its result directly into `container`.
+    """
+    class One(object):
+        pass
+
+    @adapter(One, int)
+    def to_int(obj, to_cls):
+        return 1
+
+    for max_errors in (adapt.FAIL_FAST, adapt.COLLECT_ALL):
+        result = adapt.adapt_all(
+            [One(), 2], int, max_errors=max_errors, container=TrustedList)
+        assert type(result) is TrustedList
+        assert result == [1, 2]
+
+        result = adapt.adapt_each(
+            str, [1, 2], max_errors=max_errors, container=TrustedList)
+        assert type(result) is TrustedList
+        assert result == ['1', '2']
+
+    assert type(adapt.adapt_all(None, int, container=TrustedList)) is TrustedList
+
+
+def test_trusted_custom_field():
+    """
+    Verify that a value adapted by a field is not adapted again by the same
+    field.
+    """
+    class Thing(object):
+        pass
+
+    class ThingField(object):
+        trust_results = True
+
+        def __init__(self):
+            self.calls = 0
+
+        def adapt(self, value):
+            self.calls += 1
+            if isinstance(value, Thing):
+                return value
+            return Thing()
+
+    field = ThingField()
+
+    @anticipate(field)
+    def load():
+        return {}
+
+    @anticipate(thing=field)
+    def use(thing):
+        return thing
+
+    thing = load()
+    assert field.calls == 1
+    assert use(thing) is thing
+    assert field.calls == 1
+
+    other = ThingField()
+
+    @anticipate(thing=other)
+    def use_other(thing):
+        return thing
+
+    assert use_other(thing) is thing
+    assert other.calls == 1
+
+
+def test_untrusted_custom_field():
+    """
+    Verify that values adapted by a field that does not set `trust_results`
+    are not remembered.
+    """
+    class Thing(object):
+        pass
+
+    class ThingField(object):
+        def __init__(self):
+            self.calls = 0
+
+        def adapt(self, value):
+            self.calls += 1
+            if isinstance(value, Thing):
+                return value
+            return Thing()
+
+    field = ThingField()
+
+    @anticipate(field)
+    def load():
+        return {}
+
+    @anticipate(thing=field)
+    def use(thing):
+        return thing
+
+    thing = load()
+    assert id(thing) not in trusted.__trusted__
+    assert use(thing) is thing
+    assert field.calls == 2
+
+
+def test_adapt_all_max_errors():
+    """
+    Verify adapt_all can collect errors with their positions.
+    """
+    items = ['1', [], 2, {}, (), 3.0]
+
+    with pytest.raises(adapt.AdaptErrors) as exc_info:
+        adapt.adapt_all(items, int)
+    assert not isinstance(exc_info.value, adapt.AdaptAllErrors)
+
+    with pytest.raises(adapt.AdaptAllErrors) as exc_info:
+        adapt.adapt_all(items, int, max_errors=2)
+    assert exc_info.value.positions == (1, 3)
+    assert exc_info.value.truncated
+    assert len(exc_info.value.errors) == 2
+
+    with pytest.raises(adapt.AdaptAllErrors) as exc_info:
+        adapt.adapt_all(items, int, max_errors=adapt.COLLECT_ALL)
+    assert exc_info.value.positions == (1, 3, 4)
+    assert not exc_info.value.truncated
+
+    assert adapt.adapt_all(['1', 2.0], int, max_errors=adapt.COLLECT_ALL) == [1, 2]
+
+
+def test_anticipate_max_errors():
+    """
+    Verify the default error policy applies to anticipated functions.
+    """
+    @anticipate(a=int, b=int, items=[int])
+    def get(a, b, items=None):
+        return a, b, items
+
+    try:
+        adapt.set_max_errors(adapt.FAIL_FAST)
+        with pytest.raises(AnticipateErrors) as exc_info:
+            get([], [])
+        assert len(exc_info.value.errors) == 1
+
+        adapt.set_max_errors(5)
+        with pytest.raises(AnticipateErrors) as exc_info:
+            get(1, 2, items=[1, [], 2, []])
+        assert len(exc_info.value.errors) == 1
+        e = exc_info.value.errors[0]
+        assert e.name == 'items'
+        assert e.errors[0].positions == (1, 3)
+    finally:
+        adapt.set_max_errors(None)
+
+    with pytest.raises(AnticipateErrors) as exc_info:
+        get([], [])
+    assert len(exc_info.value.errors) == 2
+
+
+def test_pickle_wrappers():
+    """
+    Verify anticipated functions and methods pickle by name.
+    """
+    assert pickle.loads(pickle.dumps(module_function)) is module_function
+    assert ModuleClass.method is ModuleClass.__dict__['method']
+
+    obj = ModuleClass()
+    method = pickle.loads(pickle.dumps(obj.method))
+    assert isinstance(method.__self__, ModuleClass)
+    assert method.__func__ is ModuleClass.__dict__['method']
+    assert method('2') == 2
+
+
+def test_pickle_errors():
+    """
+    Verify errors can be sent to other processes.
+    """
+    with pytest.raises(AnticipateErrors) as exc_info:
+        module_function([])
+
+    e = pickle.loads(pickle.dumps(exc_info.value))
+    assert str(e) == str(exc_info.value)
+    param_error = e.errors[0]
+    assert isinstance(param_error, AnticipateParamError)
+    assert param_error.name == 'value'
+    assert param_error.value == []
+    assert param_error.anticipated is int
+
+
+def test_dump_and_load_adapters():
+    """
+    Verify registered adapters can be copied to another registry.
+    """
+    adapters = adapt.dump_adapters()
+    assert (str, int, adapt.__adapters__[(str, int)]) in adapters
+
+    # Loading adapters that are already registered is a no-op
+    adapt.load_adapters(adapters)
+
+    clear_adapters()
+    adapt.load_adapters(adapters)
+    assert adapt.adapt('1', int) == 1
+
+
+def test_lazy_param():
+    """
+    Verify a lazy parameter is only adapted when it is used.
+    """
+    calls = []
+
+    class Foo(object):
+        def __init__(self, value):
+            self.value = value
+
+    @adapter(str, Foo)
+    def to_foo(obj, to_cls):
+        calls.append(obj)
+        return to_cls(obj)
+
+    @anticipate(foo=lazy(Foo))
+    def get(foo, use=False):
+        if use:
+            return foo(), foo()
+
+    assert get('a') is None
+    assert calls == []
+
+    a, b = get('a', use=True)
+    assert a is b
+    assert a.value == 'a'
+    assert calls == ['a']
+
+    with pytest.raises(AnticipateParamError) as exc_info:
+        get([], use=True)
+
+    assert exc_info.value.name == 'foo'
+    assert exc_info.value.anticipated is Foo
+
+    with pytest.raises(TypeError):
+        @anticipate(lazy(Foo))
+        def bad():
+            pass
+
+        bad()
+
+
+def test_adapt_all_typed_arrays():
+    """
+    Verify typed arrays of numbers are accepted without checking each item
+    and can be converted as a whole.
+    """
+    ints = array('q', [1, 2, 3])
+    floats = array('d', [1.0, 2.0, 3.0])
+
+    assert adapt.adapt_all(ints, int) is ints
+    assert adapt.adapt_all(floats, float) is floats
+
+    @anticipate(items=[int])
+    def get_list(items):
+        return items
+
+    assert get_list(ints) is ints
+
+    converted = adapt.adapt_all(floats, int, convert=True)
+    assert converted == array('q', [1, 2, 3])
+    assert converted.typecode == 'q'
+
+    converted = adapt.adapt_all(ints, float, convert=True)
+    assert converted.typecode == 'd'
+
+    with pytest.raises(adapt.AdaptError):
+        adapt.adapt_all(array('d', [1.5]), int, convert=True)
+
+    with pytest.raises(adapt.AdaptError):
+        adapt.adapt_all(array('d', [float('nan')]), int, convert=True)
+
+    with pytest.raises(adapt.AdaptError):
+        adapt.adapt_all(array('q', [2 ** 53 + 1]), float, convert=True)
+
+
+def test_adapt_all_numpy():
+    """
+    Verify NumPy arrays are checked by dtype.
+    """
+    numpy = pytest.importorskip('numpy')
+
+    ints = numpy.array([1, 2, 3], dtype='int64')
+    assert adapt.adapt_all(ints, int) is ints
+
+    floats = numpy.array([1.0, 2.0])
+    converted = adapt.adapt_all(floats, int, convert=True)
+    assert converted.dtype.kind == 'i'
+    assert list(converted) == [1, 2]
+
+    with pytest.raises(adapt.AdaptError):
+        adapt.adapt_all(numpy.array([1.5]), int, convert=True)
+
+
+class FakeDtype(object):
+    """
+    The part of a NumPy dtype used by `adapt_all`.
+    """
+    def __init__(self, kind):
+        self.kind = kind
+
+
+class FakeNumpyArray(object):
+    """
+    The part of a one dimensional NumPy array used by `adapt_all`, so the
+    dtype branch is tested without NumPy.
+    """
+    ndim = 1
+
+    def __init__(self, values, kind):
+        self.values = list(values)
+        self.dtype = FakeDtype(kind)
+        self.astype_calls = 0
+
+    def astype(self, dtype):
+        self.astype_calls += 1
+        kind = getattr(dtype, 'kind', None) or dtype[0]
+        to_cls = int if kind in 'iu' else float
+        return FakeNumpyArray(map(to_cls, self.values), kind)
+
+    def __eq__(self, other):
+        return FakeNumpyArray(
+            [a == b for a, b in zip(self.values, other.values)], 'b')
+
+    __hash__ = None
+
+    def all(self):
+        return all(self.values)
+
+    def __iter__(self):
+        raise AssertionError('Items should not be checked one by one')
+
+
+def test_adapt_all_numpy_dtype():
+    """
+    Verify arrays with a dtype are accepted by dtype and converted with
+    `astype`.
+    """
+    ints = FakeNumpyArray([1, 2, 3], 'i')
+    assert adapt.adapt_all(ints, int) is ints
+    assert ints.astype_calls == 0
+
+    floats = FakeNumpyArray([1.0, 2.0], 'f')
+    assert adapt.adapt_all(floats, float) is floats
+
+    converted = adapt.adapt_all(floats, int, convert=True)
+    assert converted.dtype.kind == 'i'
+    assert converted.values == [1, 2]
+    assert floats.astype_calls == 1
+
+    with pytest.raises(adapt.AdaptError):
+        adapt.adapt_all(FakeNumpyArray([1.5], 'f'), int, convert=True)
+
+
+def test_lazy_param_default():
+    """
+    Verify a lazy parameter that is not passed is still a callable that
+    returns its default.
+    """
+    class Foo(object):
+        pass
+
+    @anticipate(foo=lazy(Foo))
+    def get(bar=None, foo=None):
+        return foo()
+
+    assert get() is None
+    assert get(1) is None
+    assert get(foo=None) is None
+    assert get(1, None) is None
+
+    foo = Foo()
+    assert get(1, foo) is foo
+    assert get(foo=foo) is foo
+
+
+def test_error_message_repr():
+    """
+    Verify error messages show short values in full and shorten long ones.
+    """
+    class Foo(object):
+        pass
+
+    @adapter(Foo, int)
+    def from_foo(obj, to_cls):
+        raise TypeError('Not a number')
+
+    foo = Foo()
+    with pytest.raises(adapt.AdaptErrors) as exc_info:
+        adapt.adapt(foo, int)
+    assert repr(foo) in str(exc_info.value)
+
+    @adapter(list, int)
+    def from_list(obj, to_cls):
+        raise TypeError('Not a number')
+
+    with pytest.raises(adapt.AdaptErrors) as exc_info:
+        adapt.adapt(list(range(100000)), int)
+    assert len(str(exc_info.value)) < 500
+
+
+def test_add_error_copies_exception():
+    """
+    Verify that adding an error stores a copy of the exception without its
+    traceback and leaves the original exception alone.
+    """
+    class CustomError(Exception):
+        def __init__(self, message, code):
+            super(CustomError, self).__init__(message)
+            self.code = code
+
+    try:
+        raise CustomError('Not a number', 22)
+    except CustomError as e:
+        error = e
+        tb = e.__traceback__
+
+    errors = adapt.AdaptErrors('Failed', errors=[(None, CustomError, error, tb)])
+    assert error.__traceback__ is tb
+
+    stored = errors.errors[0][2]
+    assert stored is not error
+    assert type(stored) is CustomError
+    assert stored.args == ('Not a number',)
+    assert stored.code == 22
+    assert stored.__traceback__ is None
+    assert errors.errors[0][3][-1][2] == 'test_add_error_copies_exception'
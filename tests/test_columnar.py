@@ -0,0 +1,116 @@
+from array import array
+import pickle
+
+import pytest
+from anticipate import adapt, adapter, anticipate
+from anticipate.adapt import clear_adapters
+from anticipate.columnar import Columnar, columnar
+from anticipate.exceptions import AnticipateErrors
+
+Orders = columnar('Orders', [('id', int), ('price', float), ('sku', str)])
+
+
+def setup_function(function):
+    """
+    Make sure there are no adapters defined before start of test
+    """
+    clear_adapters()
+
+
+def test_from_dict_rows():
+    """
+    Verify a list of dicts is converted to columns.
+    """
+    orders = adapt.adapt([
+        {'id': 1, 'price': 2.5, 'sku': 'a'},
+        {'id': 2, 'price': 1, 'sku': 'b'},
+    ], Orders)
+
+    assert isinstance(orders, Orders)
+    assert isinstance(orders, Columnar)
+    assert len(orders) == 2
+    assert orders.id == array('q', [1, 2])
+    assert orders['price'] == array('d', [2.5, 1.0])
+    assert orders.sku == ['a', 'b']
+    assert list(orders) == [(1, 2.5, 'a'), (2, 1.0, 'b')]
+
+
+def test_from_tuple_rows():
+    """
+    Verify a list of tuples is converted to columns.
+    """
+    orders = adapt.adapt([(1, 2.5, 'a'), (2, 1.0, 'b')], Orders)
+    assert orders.id == array('q', [1, 2])
+    assert orders.sku == ['a', 'b']
+
+    with pytest.raises(adapt.AdaptErrors):
+        adapt.adapt([(1, 2.5)], Orders)
+
+
+def test_from_columns_without_copy():
+    """
+    Verify a dict of sequences that already have the right types is used
+    without copying.
+    """
+    ids = array('q', [1, 2])
+    prices = [2.5, 1.0]
+    skus = ['a', 'b']
+
+    orders = adapt.adapt({'id': ids, 'price': prices, 'sku': skus}, Orders)
+    assert orders.id is ids
+    assert orders.price is prices
+    assert orders.sku is skus
+
+    # Columns that do not match are converted
+    orders = adapt.adapt({'id': ids, 'price': [1, 2], 'sku': skus}, Orders)
+    assert orders.price == array('d', [1.0, 2.0])
+
+    with pytest.raises(adapt.AdaptErrors):
+        adapt.adapt({'id': [1], 'price': prices, 'sku': skus}, Orders)
+
+
+def test_column_types_are_checked():
+    """
+    Verify values are checked against their column type and adapted with
+    registered adapters.
+    """
+    with pytest.raises(adapt.AdaptErrors):
+        adapt.adapt([(1, 'abc', 'a')], Orders)
+
+    @adapter(str, float)
+    def to_float(obj, to_cls):
+        return to_cls(obj)
+
+    orders = adapt.adapt([(1, '2.5', 'a')], Orders)
+    assert orders.price == array('d', [2.5])
+
+
+def test_anticipate_columnar():
+    """
+    Verify a `Columnar` class can be anticipated.
+    """
+    @anticipate(float, orders=Orders)
+    def total(orders):
+        return sum(orders.price)
+
+    assert total([(1, 2.5, 'a'), (2, 1.0, 'b')]) == 3.5
+
+    with pytest.raises(AnticipateErrors):
+        total([{'id': 1}])
+
+
+def test_pickle():
+    """
+    Verify tables can be pickled.
+    """
+    assert Orders.__module__ == __name__
+
+    orders = adapt.adapt([(1, 2.5, 'a'), (2, 1.0, 'b')], Orders)
+    copy = pickle.loads(pickle.dumps(orders))
+
+    assert type(copy) is Orders
+    assert copy == orders
+    assert len(copy) == 2
+
+    Other = columnar('Other', [('id', int)], module='some.module')
+    assert Other.__module__ == 'some.module'
@@ -0,0 +1,196 @@
+import os
+import threading
+
+import pytest
+
+from anticipate import adapter, deferred
+from anticipate.adapt import clear_adapters
+from anticipate.decorators import deferred_anticipate
+from anticipate.exceptions import AnticipateErrors
+
+
+def setup_function(function):
+    """
+    Make sure there are no adapters defined before start of test
+    """
+    clear_adapters()
+
+
+def test_deferred_output(monkeypatch):
+    """
+    Verify that return values are returned as is and checked on a
+    background thread.
+    """
+    violations = []
+    checker = deferred.DeferredChecker(
+        handler=lambda *args: violations.append(args))
+    monkeypatch.setattr(deferred, 'checker', checker)
+
+    @deferred_anticipate(int)
+    def get_value(value):
+        return value
+
+    assert get_value(1) == 1
+    assert get_value('1') == '1'
+
+    checker.join()
+
+    assert checker.checked == 2
+    assert checker.violations == 1
+    wrapper, result, error = violations[0]
+    assert wrapper is get_value
+    assert result == '1'
+    assert isinstance(error, AnticipateErrors)
+
+
+def test_deferred_output_drops_when_full(monkeypatch):
+    """
+    Verify that values are dropped instead of blocking when the queue is
+    full.
+    """
+    started = threading.Event()
+    release = threading.Event()
+
+    def handler(wrapper, result, error):
+        started.set()
+        release.wait()
+
+    checker = deferred.DeferredChecker(maxsize=1, handler=handler)
+    monkeypatch.setattr(deferred, 'checker', checker)
+
+    @deferred_anticipate(int)
+    def get_value(value):
+        return value
+
+    assert get_value('a') == 'a'
+    started.wait()
+
+    assert get_value('b') == 'b'
+    assert get_value('c') == 'c'
+    assert checker.dropped == 1
+
+    release.set()
+    checker.join()
+    assert checker.checked == 2
+
+
+def test_deferred_output_after_fork(monkeypatch):
+    """
+    Verify that values are checked in a forked child process.
+    """
+    if not hasattr(os, 'fork'):
+        pytest.skip('os.fork is not available')
+
+    checker = deferred.DeferredChecker()
+    monkeypatch.setattr(deferred, 'checker', checker)
+
+    @deferred_anticipate(int)
+    def get_value(value):
+        return value
+
+    # Start the worker thread in the parent
+    get_value('a')
+    checker.join()
+
+    pid = os.fork()
+    if pid == 0:
+        try:
+            get_value('b')
+            checker.join()
+            os._exit(0 if checker.checked == 2 and not checker.dropped else 1)
+        finally:
+            os._exit(2)
+
+    _, status = os.waitpid(pid, 0)
+    assert os.WEXITSTATUS(status) == 0
+
+
+def test_deferred_without_returns_is_not_queued(monkeypatch):
+    """
+    Verify nothing is queued when there is nothing to check.
+    """
+    checker = deferred.DeferredChecker()
+    monkeypatch.setattr(deferred, 'checker', checker)
+
+    @deferred_anticipate()
+    def get_value(value):
+        return value
+
+    assert get_value('a') == 'a'
+    assert checker.queue.qsize() == 0
+    assert checker._thread is None
+
+
+def test_deferred_output_does_not_adapt(monkeypatch):
+    """
+    Verify that values are checked without running registered adapters, and
+    that a value that would have been adapted is reported.
+    """
+    violations = []
+    checker = deferred.DeferredChecker(
+        handler=lambda *args: violations.append(args))
+    monkeypatch.setattr(deferred, 'checker', checker)
+
+    calls = []
+
+    @adapter(str, int)
+    def to_int(value, to_cls):
+        calls.append(threading.current_thread().name)
+        return int(value)
+
+    @deferred_anticipate(int)
+    def get_value(value):
+        return value
+
+    @deferred_anticipate([int])
+    def get_values(values):
+        return values
+
+    assert get_value('5') == '5'
+    assert get_values([1, None, 2]) == [1, None, 2]
+    assert get_values([1, '2']) == [1, '2']
+
+    values = iter([1, 2])
+    assert get_values(values) is values
+
+    checker.join()
+
+    assert calls == []
+    assert checker.checked == 4
+    assert checker.violations == 3
+    assert [result for _, result, _ in violations][:2] == ['5', [1, '2']]
+
+
+def test_deferred_output_with_adapt_object(monkeypatch):
+    """
+    Verify that objects that implement `adapt` must return the value they
+    are given.
+    """
+    violations = []
+    checker = deferred.DeferredChecker(
+        handler=lambda *args: violations.append(args))
+    monkeypatch.setattr(deferred, 'checker', checker)
+
+    class Upper(object):
+        def adapt(self, value):
+            if value.isupper():
+                return value
+            return value.upper()
+
+    @deferred_anticipate(Upper())
+    def get_value(value):
+        return value
+
+    @deferred_anticipate([Upper()])
+    def get_values(values):
+        return values
+
+    assert get_value('A') == 'A'
+    assert get_value('a') == 'a'
+    assert get_values(['A', 'B']) == ['A', 'B']
+    assert get_values(['A', 'b']) == ['A', 'b']
+
+    checker.join()
+
+    assert checker.checked == 4
+    assert [result for _, result, _ in violations] == ['a', ['A', 'b']]